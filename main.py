@@ -1,24 +1,94 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+from io import BytesIO
+
+from async_lru import alru_cache
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from supabase import create_client
+from gtts import gTTS
+from datetime import datetime, timezone
+
+import asyncio
+import asyncpg
 import cohere
+import hashlib
+import httpx
+import orjson
 import os
-import re
 from dotenv import load_dotenv
 import logging
 
-# Load environment variables
-load_dotenv()
+# Populated by lifespan once the environment is loaded
+SUPABASE_URL = None
+SUPABASE_HEADERS: dict = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global SUPABASE_URL, SUPABASE_HEADERS
+
+    # Load environment and warm all shared state once per worker, with a
+    # matching shutdown so no pool leaks sockets on reload
+    load_dotenv()
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    cohere_api_key = os.getenv("COHERE_API_KEY")
+
+    # Headers for talking to the Supabase PostgREST API directly
+    SUPABASE_HEADERS = {
+        "apikey": supabase_key,
+        "Authorization": f"Bearer {supabase_key}",
+    }
+
+    # Shared async HTTP pool for Supabase so DB I/O never blocks the event loop
+    app.state.http = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+    )
+    # Bounded HTTP/2 pool for Cohere: concurrent summaries multiplex over
+    # one keepalive TLS session instead of handshaking per call. http2 and
+    # limits must live on the explicit transport — client-level values are
+    # ignored once a transport is passed
+    cohere_http = httpx.AsyncClient(
+        timeout=httpx.Timeout(30, connect=5),
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        ),
+    )
+    app.state.cohere = cohere.AsyncClient(cohere_api_key, httpx_client=cohere_http)
+
+    # Optional direct-Postgres pool for hot reads: skips the HTTP+PostgREST
+    # layer entirely when a database DSN is configured
+    dsn = os.getenv("SUPABASE_DB_URL")
+    app.state.pool = None
+    if dsn:
+        app.state.pool = await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=2,
+            max_size=10,
+            # Transaction-mode poolers (Supavisor/pgbouncer) can't reuse
+            # server-side prepared statements
+            statement_cache_size=0 if os.getenv("SUPABASE_DB_POOLED") else 1024,
+        )
+
+    yield
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
+    await app.state.http.aclose()
+    await cohere_http.aclose()
+    if app.state.pool is not None:
+        await app.state.pool.close()
 
 # Initialize services
-app = FastAPI()
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-cohere_client = cohere.Client(COHERE_API_KEY)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Cap concurrent Cohere calls to stay within API rate limits
+COHERE_SEM = asyncio.Semaphore(8)
+
+# Single-flight map: coalesces concurrent identical work onto one task
+_inflight: dict[str, asyncio.Task] = {}
+_inflight_lock = asyncio.Lock()
 
 # CORS Setup
 app.add_middleware(
@@ -31,41 +101,143 @@ app.add_middleware(
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+# Validation tables built once at import time
+_DASH_TABLE = str.maketrans("_-", "  ")
+# Every byte outside the ASCII [A-Za-z0-9 _-] whitelist; bytes.translate
+# with this delete table scans the whole string in one C loop, no regex
+# engine involved. Deliberately stricter than the old ^[\w\s-]+$ pattern:
+# non-ASCII names (accents etc.) are rejected rather than validated
+# byte-by-byte against their UTF-8 encoding
+_BAD_BYTES = bytes(
+    i for i in range(256)
+    if not ((i < 128 and chr(i).isalnum()) or chr(i) in " -_")
+)
+
 def validate_disease_name(name: str) -> str:
     """Sanitize and validate disease input"""
-    clean_name = re.sub(r'[_-]', ' ', name).strip().lower()
-    if not re.match(r'^[\w\s-]+$', clean_name):
+    clean_name = name.translate(_DASH_TABLE).strip().lower()
+    raw = clean_name.encode()
+    if not raw or raw.translate(None, delete=_BAD_BYTES) != raw:
         raise HTTPException(400, detail="Invalid characters in disease name")
     if len(clean_name) > 50:
         raise HTTPException(400, detail="Disease name too long (max 50 chars)")
     return clean_name
 
+_REMEDIES_SQL = """
+SELECT d.description,
+       coalesce(
+           json_agg(json_build_object(
+               'herb_name', hr.herb_name,
+               'preparation', hr.preparation,
+               'dosage', hr.dosage,
+               'safety_notes', hr.safety_notes
+           )) FILTER (WHERE hr.id IS NOT NULL),
+           '[]'
+       ) AS remedies
+FROM diseases d
+LEFT JOIN herbal_remedies hr ON hr.disease_id = d.id
+WHERE lower(d.name) = $1
+GROUP BY d.id
+"""
+
+@alru_cache(maxsize=1024, ttl=3600)
+async def _fetch_remedies(clean_disease: str) -> dict:
+    """Fetch a disease and its remedies from Supabase (cached for an hour)"""
+    # Prefer the direct asyncpg pool when configured: one prepared join,
+    # no HTTP/PostgREST hop
+    if app.state.pool is not None:
+        async with app.state.pool.acquire() as con:
+            row = await con.fetchrow(_REMEDIES_SQL, clean_disease)
+
+        if row is None:
+            raise HTTPException(404, detail=f"Disease '{clean_disease}' not found")
+
+        return {
+            "disease": clean_disease,
+            "description": row["description"] or "",
+            "remedies": orjson.loads(row["remedies"])
+        }
+
+    # Single query: disease row with its remedies embedded via the FK.
+    # ilike keeps the match case-insensitive regardless of how the name is
+    # stored; the asyncpg branch above gets the diseases_lower_name_uidx
+    # index (sql/indexes.sql) through its lower(d.name) filter
+    disease_resp = await app.state.http.get(
+        f"{SUPABASE_URL}/rest/v1/diseases"
+        f"?name=ilike.{clean_disease}"
+        "&select=id,description,herbal_remedies(herb_name,preparation,dosage,safety_notes)"
+        "&limit=1",
+        headers=SUPABASE_HEADERS,
+    )
+    disease_resp.raise_for_status()
+    disease_data = disease_resp.json()
+
+    if not disease_data:
+        raise HTTPException(404, detail=f"Disease '{clean_disease}' not found")
+
+    return {
+        "disease": clean_disease,
+        "description": disease_data[0].get("description", ""),
+        "remedies": disease_data[0].get("herbal_remedies", [])
+    }
+
+@app.get("/remedies")
+async def get_remedies_bulk(names: list[str] = Query(...)):
+    """Get herbal remedies for several diseases in one query"""
+    try:
+        # Accept both repeated ?names= params and comma-separated lists,
+        # capped so the or=(...) filter can't grow into an unbounded URL
+        parts = [part for name in names for part in name.split(",")]
+        if len(parts) > 50:
+            raise HTTPException(400, detail="Too many disease names (max 50)")
+        cleaned = [validate_disease_name(part) for part in parts]
+
+        # or=(...ilike...) keeps the bulk match case-insensitive like the
+        # single-disease path; in.() would compare case-sensitively
+        filters = ",".join(f'name.ilike."{n}"' for n in cleaned)
+        resp = await app.state.http.get(
+            f"{SUPABASE_URL}/rest/v1/diseases"
+            f"?or=({filters})"
+            "&select=name,description,herbal_remedies(herb_name,preparation,dosage,safety_notes)",
+            headers=SUPABASE_HEADERS,
+        )
+        resp.raise_for_status()
+
+        return {
+            "results": [
+                {
+                    "disease": row["name"],
+                    "description": row.get("description", ""),
+                    "remedies": row.get("herbal_remedies", [])
+                }
+                for row in resp.json()
+            ]
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logging.error(f"Error in get_remedies_bulk: {str(e)}")
+        raise HTTPException(500, detail=f"Database error: {str(e)}")
+
 @app.get("/remedies/{disease}")
-async def get_remedies(disease: str):
+async def get_remedies(disease: str, request: Request):
     """Get herbal remedies for a disease"""
     try:
         clean_disease = validate_disease_name(disease)
-        
-        # Get disease info with exact match
-        disease_data = supabase.table("diseases") \
-            .select("*") \
-            .ilike("name", clean_disease) \
-            .execute()
-            
-        if not disease_data.data:
-            raise HTTPException(404, detail=f"Disease '{clean_disease}' not found")
-        
-        # Get related remedies
-        remedies = supabase.table("herbal_remedies") \
-            .select("herb_name, preparation, dosage, safety_notes") \
-            .eq("disease_id", disease_data.data[0]["id"]) \
-            .execute()
+        payload = await _fetch_remedies(clean_disease)
 
-        return {
-            "disease": clean_disease,
-            "description": disease_data.data[0].get("description", ""),
-            "remedies": remedies.data
+        # Weak ETag over the JSON body so browsers/CDNs can revalidate
+        # cheaply and skip re-fetching unchanged reference data
+        body = orjson.dumps(payload)
+        etag = 'W/"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=3600, stale-while-revalidate=86400",
         }
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except HTTPException as he:
         raise he
@@ -73,51 +245,160 @@ async def get_remedies(disease: str):
         logging.error(f"Error in get_remedies: {str(e)}")
         raise HTTPException(500, detail=f"Database error: {str(e)}")
 
+# Prompt skeleton built once; per-request work is a join plus one format call
+PROMPT_TMPL = """Generate a comprehensive herbal remedy summary for {disease} using this data:
+
+**Description**: {description}
+
+**Recommended Herbal Remedies**:
+{remedies}
+
+Include key safety considerations and format the response using markdown with clear sections."""
+
+def _fmt_remedy(r: dict) -> str:
+    """Format one remedy row as a markdown bullet"""
+    line = f"- **{r['herb_name']}**: {r['preparation']} ({r['dosage']})"
+    return (
+        f"{line}\n  - Safety Notes: {r['safety_notes']}" if r['safety_notes']
+        else line
+    )
+
+async def _load_stored_summary(clean_disease: str):
+    """Read the persisted summary_md for a disease, if any"""
+    if app.state.pool is not None:
+        async with app.state.pool.acquire() as con:
+            return await con.fetchval(
+                "SELECT summary_md FROM diseases WHERE lower(name) = $1",
+                clean_disease,
+            )
+
+    resp = await app.state.http.get(
+        f"{SUPABASE_URL}/rest/v1/diseases"
+        f"?name=ilike.{clean_disease}&select=summary_md&limit=1",
+        headers=SUPABASE_HEADERS,
+    )
+    resp.raise_for_status()
+    rows = resp.json()
+    return rows[0].get("summary_md") if rows else None
+
+async def _store_summary(clean_disease: str, summary: str):
+    """Persist a generated summary; best effort, never fails the request"""
+    try:
+        if app.state.pool is not None:
+            async with app.state.pool.acquire() as con:
+                await con.execute(
+                    "UPDATE diseases SET summary_md = $2,"
+                    " summary_generated_at = now() WHERE lower(name) = $1",
+                    clean_disease, summary,
+                )
+        else:
+            resp = await app.state.http.patch(
+                f"{SUPABASE_URL}/rest/v1/diseases?name=ilike.{clean_disease}",
+                headers=SUPABASE_HEADERS,
+                json={
+                    "summary_md": summary,
+                    "summary_generated_at": datetime.now(timezone.utc).isoformat(),
+                },
+            )
+            resp.raise_for_status()
+    except Exception as e:
+        logging.error(f"Failed to persist summary for {clean_disease}: {str(e)}")
+
+async def _yield_text(text: str):
+    """Serve an already-complete summary as a one-chunk stream"""
+    yield text
+
+async def _generate_summary(clean_disease: str, prompt: str, queue: asyncio.Queue) -> str:
+    """Produce the summary: stream Cohere tokens into `queue`, then persist
+
+    Runs as the single-flight task so it always completes — even if the
+    requesting client disconnects — and its result is the full text.
+    Tokens go through the (unbounded, <= max_tokens entries) queue so the
+    COHERE_SEM permit is released as soon as Cohere's stream is exhausted,
+    not held while a slow client drains the response.
+    """
+    chunks = []
+    try:
+        async with COHERE_SEM:
+            stream = app.state.cohere.chat_stream(
+                model="command",
+                message=prompt,
+                max_tokens=300,
+                temperature=0.5,
+            )
+            async for ev in stream:
+                if ev.event_type == "text-generation":
+                    chunks.append(ev.text)
+                    queue.put_nowait(ev.text)
+    except Exception as e:
+        logging.error(f"Cohere stream error: {str(e)}")
+        raise
+    finally:
+        # Sentinel: the consumer stops here whether we succeeded or not
+        queue.put_nowait(None)
+
+    summary = "".join(chunks)
+    await _store_summary(clean_disease, summary)
+    return summary
+
+async def _stream_summary(queue: asyncio.Queue, producer: asyncio.Task):
+    """Relay produced tokens to the client as they arrive"""
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            break
+        yield chunk
+    # Surface a producer failure instead of ending the stream silently
+    await producer
+
 @app.get("/cohere-summary/{disease}")
 async def generate_summary(disease: str):
-    """Generate AI summary using Cohere"""
+    """Generate AI summary using Cohere, streamed token by token"""
     try:
-        # Get remedies first
-        remedies_data = await get_remedies(disease)
-        
-        # Build remedy lines with proper formatting
-        remedy_lines = []
-        for r in remedies_data['remedies']:
-            line = f"- **{r['herb_name']}**: {r['preparation']} ({r['dosage']})"
-            if r['safety_notes']:
-                line += f"\n  - Safety Notes: {r['safety_notes']}"
-            remedy_lines.append(line)
-        
-        # Join remedy_lines outside the f-string to avoid f-string escape issues
-        joined_remedies = "\n".join(remedy_lines)
-
-        prompt = f"""Generate a comprehensive herbal remedy summary for {remedies_data['disease']} using this data:
-        
-**Description**: {remedies_data['description']}
+        clean_disease = validate_disease_name(disease)
 
-**Recommended Herbal Remedies**:
-{joined_remedies}
+        # Persisted summary (sql/summary_column.sql): a pure DB read,
+        # streamed as a single chunk
+        stored = await _load_stored_summary(clean_disease)
+        if stored:
+            return StreamingResponse(
+                _yield_text(stored), media_type="text/event-stream"
+            )
 
-Include key safety considerations and format the response using markdown with clear sections."""
-        
-        # Get Cohere response
-        response = cohere_client.generate(
-            model="command",
-            prompt=prompt,
-            max_tokens=300,
-            temperature=0.5,
-            presence_penalty=0.3
+        # Anything that can fail per-request (404s included) happens before
+        # the single-flight registration so a failure can't strand the key
+        remedies_data = await _fetch_remedies(clean_disease)
+        prompt = PROMPT_TMPL.format(
+            disease=remedies_data['disease'],
+            description=remedies_data['description'],
+            remedies="\n".join(_fmt_remedy(r) for r in remedies_data['remedies']),
         )
 
-        if not response.generations:
-            raise HTTPException(500, detail="Empty response from Cohere API")
+        # Single-flight: the first request starts the producer task and
+        # streams live tokens; concurrent duplicates await the finished text
+        key = f"summary:{clean_disease}"
+        async with _inflight_lock:
+            producer = _inflight.get(key)
+            leader = producer is None
+            if leader:
+                queue = asyncio.Queue()
+                producer = asyncio.create_task(
+                    _generate_summary(clean_disease, prompt, queue)
+                )
+                producer.add_done_callback(lambda _: _inflight.pop(key, None))
+                _inflight[key] = producer
 
-        return {
-            "summary": response.generations[0].text,
-            "original_data": remedies_data
-        }
+        if not leader:
+            return StreamingResponse(
+                _yield_text(await producer), media_type="text/event-stream"
+            )
+
+        return StreamingResponse(
+            _stream_summary(queue, producer),
+            media_type="text/event-stream",
+        )
 
-    except cohere.CohereError as ce:
+    except cohere.core.ApiError as ce:
         logging.error(f"Cohere API error: {str(ce)}")
         raise HTTPException(503, detail=f"Cohere API error: {str(ce)}")
     except HTTPException as he:
@@ -126,7 +407,60 @@ Include key safety considerations and format the response using markdown with cl
         logging.error(f"Error in generate_summary: {str(e)}")
         raise HTTPException(500, detail=f"Summary error: {str(e)}")
 
+def _synthesize(text: str) -> bytes:
+    """Render text to MP3 bytes with gTTS (blocking; run in a thread)"""
+    buf = BytesIO()
+    gTTS(text=text, lang="en").write_to_fp(buf)
+    return buf.getvalue()
+
+@alru_cache(maxsize=256, ttl=604800)
+async def _synthesize_cached(text: str) -> bytes:
+    """Synthesize audio for text, keeping the bytes for a week"""
+    return await asyncio.to_thread(_synthesize, text)
+
+@app.get("/text-to-speech")
+async def text_to_speech(text: str):
+    """Convert remedy text to speech audio"""
+    try:
+        if not text.strip():
+            raise HTTPException(400, detail="Text must not be empty")
+        if len(text) > 1000:
+            raise HTTPException(400, detail="Text too long (max 1000 chars)")
+
+        # gTTS does a blocking HTTP call; keep it off the event loop and
+        # serve repeat texts from the byte cache
+        audio_bytes = await _synthesize_cached(text)
+
+        # Let browsers/CDNs cache identical audio for a week too
+        key = hashlib.sha256(text.encode()).hexdigest()
+        return Response(
+            content=audio_bytes,
+            media_type="audio/mpeg",
+            headers={
+                "ETag": f'"{key}"',
+                "Cache-Control": "public, max-age=604800",
+            },
+        )
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logging.error(f"Error in text_to_speech: {str(e)}")
+        raise HTTPException(500, detail=f"Speech error: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        # Single worker on purpose: the alru caches, COHERE_SEM and the
+        # single-flight map are all per-process. Scaling out needs a shared
+        # cache (e.g. Redis) first, or each worker re-generates and the
+        # Cohere gate multiplies per process
+        workers=1,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )
 
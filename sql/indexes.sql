@@ -0,0 +1,11 @@
+-- Run once in the Supabase SQL editor.
+--
+-- Disease lookups filter on the (lower-cased) name and remedies are
+-- embedded through disease_id; without these indexes both paths fall
+-- back to sequential scans as the tables grow.
+
+CREATE UNIQUE INDEX IF NOT EXISTS diseases_lower_name_uidx
+    ON diseases (lower(name));
+
+CREATE INDEX IF NOT EXISTS herbal_remedies_disease_id_idx
+    ON herbal_remedies (disease_id);
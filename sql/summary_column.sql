@@ -0,0 +1,11 @@
+-- Run once in the Supabase SQL editor.
+--
+-- Stores the generated Cohere summary on the disease row so
+-- /cohere-summary becomes a plain DB read after the first request.
+-- The app writes these columns back after generating; clear
+-- summary_md (e.g. from a trigger on herbal_remedies) to force a
+-- regeneration on the next request.
+
+ALTER TABLE diseases
+    ADD COLUMN IF NOT EXISTS summary_md text,
+    ADD COLUMN IF NOT EXISTS summary_generated_at timestamptz;